@@ -1,9 +1,12 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
 import io
-import re
 from datetime import datetime
-from typing import Dict, Optional, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 # Column mapping based on MAP.xlsx
 COLUMN_MAPPING = {
@@ -19,76 +22,283 @@ COLUMN_MAPPING = {
     "PROP_ZIP": "Property Zip"
 }
 
-def deduplicate_dataframe(df: pd.DataFrame) -> Tuple[pd.DataFrame, int]:
+# Mapped columns that together identify a unique owner + mailing address
+DEDUP_COLUMNS = ["First Name", "Last Name", "Mailing Address", "Mailing City", "Mailing State"]
+
+# Unique record id columns that can be used as the dedup key instead of
+# owner name + mailing address, when present in the input
+DEDUP_KEY_COLUMNS = ["APN", "PARCEL_ID"]
+
+# Dedup key option for the default owner name + mailing address comparison
+AUTO_DEDUP_KEY = "(auto: name+address)"
+
+# Dedup key columns are joined with a separator that does not occur in text
+KEY_SEPARATOR = "\x1f"
+
+# Approximate bytes of CSV parsed per chunk; bounds peak memory for large files
+CHUNK_BLOCK_SIZE = 16 << 20
+
+# Rows per chunk when falling back to the pandas CSV reader
+PANDAS_CHUNK_ROWS = 100_000
+
+# Uploads (or upload + reference code combinations) kept in each cache; every
+# _process entry holds a full output frame
+CACHE_MAX_ENTRIES = 4
+
+# Bytes parsed for the input preview, which only needs the first rows
+PREVIEW_BLOCK_SIZE = 1 << 20
+
+# Removes characters that are invalid in filenames and replaces spaces with
+# underscores, in a single pass over the string
+FILENAME_TRANSLATION = str.maketrans({**{char: None for char in '<>:"/\\|?*'}, ' ': '_'})
+
+@st.cache_resource
+def _mapping_constants() -> Dict[str, Any]:
+    """
+    Structures derived from COLUMN_MAPPING, built once per process instead of on every rerun.
+    
+    Returns:
+        Dict with the source column list, target column list and the static
+        source/target mapping table. Callers must not mutate these.
+    """
+    return {
+        "source_columns": list(COLUMN_MAPPING),
+        "target_columns": list(COLUMN_MAPPING.values()),
+        "mapping_table": pd.DataFrame({
+            "Source Column": list(COLUMN_MAPPING),
+            "Target Column": list(COLUMN_MAPPING.values())
+        })
+    }
+
+def normalize_key_column(column: pd.Series) -> pd.Series:
+    """
+    Trim and upper-case a string column for dedup comparison using Arrow compute kernels.
+    
+    Args:
+        column: String column (Arrow-backed or object dtype)
+        
+    Returns:
+        Arrow-backed string column with NaN values replaced by empty strings
+    """
+    # Arrow-backed columns convert without copying; object columns are encoded once
+    values = pa.array(column, type=pa.string(), from_pandas=True)
+    values = pc.utf8_upper(pc.utf8_trim_whitespace(pc.fill_null(values, "")))
+    return pd.Series(pd.arrays.ArrowExtensionArray(values), index=column.index)
+
+def deduplicate_dataframe(df: pd.DataFrame, seen: Optional[List[np.ndarray]] = None,
+                          key_column: Optional[str] = None) -> Tuple[pd.DataFrame, int]:
     """
     Remove duplicate records based on owner name and mailing address combination.
     
     Args:
         df: Input DataFrame with mapped columns
+        seen: Single-element list holding the sorted 64-bit key hashes of the
+            records kept from earlier chunks of the same file. Records whose
+            key hash matches one of these are dropped, and the array is replaced
+            by one that also holds the hashes of the records kept here.
+            Matches across chunks are hash-based: two distinct keys that share a
+            hash would drop a real record. With n records kept the chance of
+            any collision is at most n^2 / 2^65 (about 3e-6 for 10M records).
+            Matches within a chunk compare the keys exactly.
+        key_column: Unique record id column (e.g. APN) to deduplicate on instead
+            of owner name + mailing address. Records without an id are kept.
         
     Returns:
         Tuple of (deduplicated DataFrame, number of duplicates removed)
     """
-    initial_count = len(df)
+    if key_column is not None:
+        # A unique record id is compared as-is, skipping the name and address
+        # normalization entirely
+        has_key = df[key_column].notna()
+        duplicate_mask = df[key_column].duplicated(keep='first') & has_key
+        kept = ~duplicate_mask & has_key
+        
+        if seen is not None:
+            # Hash the id column whatever its dtype (ids are often numeric)
+            key_hashes = pd.util.hash_pandas_object(df.loc[kept, key_column], index=False).to_numpy()
+    else:
+        # Owner name + mailing address should uniquely identify a unique
+        # owner-mailing address relationship
+        
+        # Normalize the key columns for case-insensitive comparison. The output
+        # keeps the original values; only the duplicate mask is taken from these.
+        key_columns = {col: normalize_key_column(df[col]) for col in DEDUP_COLUMNS}
+        
+        # Keep the first occurrence of each unique combination
+        duplicate_mask = pd.DataFrame(key_columns).duplicated(keep='first')
+        kept = ~duplicate_mask
+        
+        if seen is not None:
+            # Join the key columns of the records still kept and hash each key
+            # to a 64-bit integer in one vectorized pass
+            keys = pc.binary_join_element_wise(*[pa.array(key_columns[col]) for col in DEDUP_COLUMNS], KEY_SEPARATOR)
+            keys = pc.filter(keys, pa.array(kept.to_numpy()))
+            key_hashes = pd.util.hash_array(keys.to_numpy(zero_copy_only=False), categorize=False)
+    
+    if seen is not None:
+        # Records are also compared against earlier chunks; only the 64-bit key
+        # hashes are kept between them. Look the hashes up in the sorted array
+        # of earlier hashes with a binary search, then merge the new ones in.
+        previous = seen[0]
+        seen_before = np.zeros(len(key_hashes), dtype=bool)
+        if len(previous):
+            positions = np.searchsorted(previous, key_hashes).clip(max=len(previous) - 1)
+            seen_before = previous[positions] == key_hashes
+        
+        duplicate_mask.loc[kept] = seen_before
+        seen[0] = np.sort(np.concatenate([previous, key_hashes[~seen_before]]), kind='stable')
+    
+    df_deduped = df.loc[~duplicate_mask]
     
-    # Create a composite key for deduplication based on:
-    # - Owner full name (First Name + Last Name)
-    # - Mailing Address
-    # This combination should uniquely identify a unique owner-mailing address relationship
+    duplicates_removed = int(duplicate_mask.sum())
+    
+    return df_deduped, duplicates_removed
+
+def find_mapped_columns(df: pd.DataFrame) -> Dict[str, str]:
+    """
+    Find the source columns from the mapping that are present in the input.
+    
+    Args:
+        df: Input DataFrame
+        
+    Returns:
+        Mapping of present source columns to target columns, in mapping order
+    """
+    columns = set(df.columns)
+    return {source: target for source, target in COLUMN_MAPPING.items() if source in columns}
+
+def warn_missing_columns(present_columns: Dict[str, str]) -> None:
+    """
+    Warn about source columns that are missing and will be created empty.
     
-    # Fill NaN values with empty strings for consistent comparison
-    df_clean = df.fillna('')
+    Args:
+        present_columns: Result of find_mapped_columns for the input
+    """
+    missing = [source for source in COLUMN_MAPPING if source not in present_columns]
     
-    # Create composite key columns for deduplication
-    df_clean['_dedup_owner'] = (df_clean['First Name'].str.strip().str.upper() + 
-                               ' ' + df_clean['Last Name'].str.strip().str.upper()).str.strip()
+    if missing:
+        st.warning(
+            f"Columns not found in input file: {missing}. Created empty "
+            f"{[COLUMN_MAPPING[col] for col in missing]} columns."
+        )
+
+def map_columns(df: pd.DataFrame, property_ref_code: str, present_columns: Dict[str, str]) -> pd.DataFrame:
+    """
+    Map input columns to the output columns and add the custom field.
     
-    df_clean['_dedup_mailing'] = (df_clean['Mailing Address'].str.strip().str.upper() + 
-                                 ' ' + df_clean['Mailing City'].str.strip().str.upper() + 
-                                 ' ' + df_clean['Mailing State'].str.strip().str.upper()).str.strip()
+    Args:
+        df: Input DataFrame
+        property_ref_code: Custom property reference code
+        present_columns: Result of find_mapped_columns(df)
+        
+    Returns:
+        DataFrame with mapped columns
+    """
+    # Select and rename the mapped columns in a single pass; missing source
+    # columns become empty target columns
+    mapped_df = df[list(present_columns)].rename(columns=present_columns).reindex(
+        columns=_mapping_constants()["target_columns"], fill_value=""
+    )
     
-    # Remove duplicates based on the composite key
-    # Keep the first occurrence of each unique combination
-    df_deduped = df_clean.drop_duplicates(subset=['_dedup_owner', '_dedup_mailing'], keep='first')
+    # Add the custom field
+    mapped_df["Custom Field 1"] = property_ref_code
     
-    # Remove the temporary deduplication columns
-    df_deduped = df_deduped.drop(columns=['_dedup_owner', '_dedup_mailing'])
+    return mapped_df
+
+def map_and_deduplicate(df: pd.DataFrame, property_ref_code: str, present_columns: Dict[str, str],
+                        seen: Optional[List[np.ndarray]] = None,
+                        dedup_key: Optional[str] = None) -> Tuple[pd.DataFrame, int]:
+    """
+    Map and deduplicate one input DataFrame (or chunk).
     
-    # Calculate number of duplicates removed
-    duplicates_removed = initial_count - len(df_deduped)
+    Args:
+        df: Input DataFrame
+        property_ref_code: Custom property reference code
+        present_columns: Result of find_mapped_columns(df)
+        seen: Dedup state shared across chunks, see deduplicate_dataframe
+        dedup_key: Unique record id column to deduplicate on, see deduplicate_dataframe
+        
+    Returns:
+        Tuple of (processed DataFrame with mapped columns, number of duplicates removed)
+    """
+    if dedup_key is not None:
+        # The id column is not mapped, so deduplicate before mapping
+        deduplicated_df, duplicates_removed = deduplicate_dataframe(df, seen, key_column=dedup_key)
+        return map_columns(deduplicated_df, property_ref_code, present_columns), duplicates_removed
     
-    return df_deduped, duplicates_removed
+    mapped_df = map_columns(df, property_ref_code, present_columns)
+    return deduplicate_dataframe(mapped_df, seen)
 
-def process_csv(df: pd.DataFrame, property_ref_code: str) -> Tuple[pd.DataFrame, int]:
+def process_csv(df: pd.DataFrame, property_ref_code: str,
+                present_columns: Optional[Dict[str, str]] = None,
+                dedup_key: Optional[str] = None) -> Tuple[pd.DataFrame, int]:
     """
     Process the input CSV by mapping columns, adding custom field, and deduplicating.
     
     Args:
         df: Input DataFrame
         property_ref_code: Custom property reference code
+        present_columns: Result of find_mapped_columns(df), if already computed
+        dedup_key: Unique record id column to deduplicate on instead of owner
+            name + mailing address, if any
         
     Returns:
         Tuple of (processed DataFrame with mapped columns, number of duplicates removed)
     """
-    # Create new DataFrame with only the columns we want to keep
-    mapped_df = pd.DataFrame()
+    if present_columns is None:
+        present_columns = find_mapped_columns(df)
+    warn_missing_columns(present_columns)
     
-    # Map existing columns according to the mapping
-    for source_col, target_col in COLUMN_MAPPING.items():
-        if source_col in df.columns:
-            mapped_df[target_col] = df[source_col]
-        else:
-            # Create empty column if source column doesn't exist
-            mapped_df[target_col] = ""
-            st.warning(f"Column '{source_col}' not found in input file. Created empty '{target_col}' column.")
+    return map_and_deduplicate(df, property_ref_code, present_columns, dedup_key=dedup_key)
+
+def process_csv_chunks(chunks: Iterable[pd.DataFrame], property_ref_code: str,
+                       present_columns: Dict[str, str],
+                       dedup_key: Optional[str] = None) -> Tuple[pd.DataFrame, int, int]:
+    """
+    Process the input CSV chunk by chunk, deduplicating across chunks.
     
-    # Add the custom field
-    mapped_df["Custom Field 1"] = property_ref_code
+    Besides the raw upload and the output, only the current and next chunk
+    and the key hashes of the records kept so far are held, rather than the
+    whole parsed input. The output chunks are copied once more when they are
+    concatenated at the end.
     
-    # Deduplicate the data
-    deduplicated_df, duplicates_removed = deduplicate_dataframe(mapped_df)
+    Args:
+        chunks: Input DataFrame chunks, e.g. from read_csv_chunks
+        property_ref_code: Custom property reference code
+        present_columns: Result of find_mapped_columns for the input
+        dedup_key: Unique record id column to deduplicate on instead of owner
+            name + mailing address, if any
+        
+    Returns:
+        Tuple of (processed DataFrame with mapped columns, number of input records,
+        number of duplicates removed)
+    """
+    warn_missing_columns(present_columns)
+    
+    seen = None
+    processed_chunks = []
+    input_records = 0
+    duplicates_removed = 0
+    
+    # Look one chunk ahead: keys only need hashing across chunks once there is
+    # a second one, so single-chunk inputs take the plain in-memory dedup path
+    chunks = iter(chunks)
+    chunk = next(chunks, None)
+    while chunk is not None:
+        next_chunk = next(chunks, None)
+        if seen is None and next_chunk is not None:
+            seen = [np.empty(0, dtype=np.uint64)]
+        
+        deduplicated_chunk, chunk_duplicates = map_and_deduplicate(
+            chunk, property_ref_code, present_columns, seen, dedup_key
+        )
+        
+        processed_chunks.append(deduplicated_chunk)
+        input_records += len(chunk)
+        duplicates_removed += chunk_duplicates
+        chunk = next_chunk
     
-    return deduplicated_df, duplicates_removed
+    return pd.concat(processed_chunks), input_records, duplicates_removed
 
 def generate_output_filename(property_ref_code: str) -> str:
     """
@@ -103,28 +313,27 @@ def generate_output_filename(property_ref_code: str) -> str:
     # Get current date in YYYYMMDD format
     date_str = datetime.now().strftime("%Y%m%d")
     
-    # Clean the property reference code for filename (remove invalid characters)
+    # Clean the property reference code for filename (remove invalid characters
+    # and replace spaces with underscores)
     if property_ref_code:
-        custom_field = re.sub(r'[<>:"/\\|?*]', '', str(property_ref_code))
-        custom_field = custom_field.replace(' ', '_')  # Replace spaces with underscores
+        custom_field = str(property_ref_code).translate(FILENAME_TRANSLATION)
         filename = f"{date_str}_{custom_field}_DirectSkip_Import.csv"
     else:
         filename = f"{date_str}_DirectSkip_Import.csv"
     
     return filename
 
-def validate_input_file(df: pd.DataFrame) -> bool:
+def validate_input_file(present_columns: Dict[str, str]) -> bool:
     """
     Validate that the input CSV has expected structure.
     
     Args:
-        df: Input DataFrame
+        present_columns: Result of find_mapped_columns for the input DataFrame
         
     Returns:
         True if valid, False otherwise
     """
-    expected_columns = list(COLUMN_MAPPING.keys())
-    missing_columns = [col for col in expected_columns if col not in df.columns]
+    missing_columns = [col for col in COLUMN_MAPPING if col not in present_columns]
     
     if missing_columns:
         st.error(f"Missing expected columns: {missing_columns}")
@@ -132,6 +341,215 @@ def validate_input_file(df: pd.DataFrame) -> bool:
     
     return True
 
+def read_csv_header(file_bytes: bytes) -> List[str]:
+    """
+    Read the column names of the uploaded CSV.
+    
+    Args:
+        file_bytes: Raw bytes of the uploaded CSV file
+        
+    Returns:
+        Column names in file order
+    """
+    # pandas tolerates short rows that make the Arrow reader fail, see read_csv_chunks_pandas
+    return pd.read_csv(io.BytesIO(file_bytes), nrows=0).columns.tolist()
+
+def read_csv_chunks(file_bytes: bytes, block_size: int = CHUNK_BLOCK_SIZE,
+                    extra_columns: Iterable[str] = ()) -> Iterator[pd.DataFrame]:
+    """
+    Stream the uploaded CSV as DataFrame chunks holding only the mapped columns.
+    
+    Uploads that fit in one block are parsed in a single chunk with the
+    multi-threaded pacsv.read_csv. Larger uploads are streamed with
+    pacsv.open_csv, which is single-threaded: this trades parse speed for
+    not holding the whole parsed input in memory at once.
+    
+    Args:
+        file_bytes: Raw bytes of the uploaded CSV file
+        block_size: Approximate number of bytes of CSV parsed per chunk
+        extra_columns: Unmapped columns to read as well, e.g. the dedup key
+        
+    Yields:
+        Input DataFrame chunks, indexed by row number in the file. A file with
+        no data rows yields a single empty chunk.
+    """
+    # Only parse the columns we map; everything else in wide exports is skipped.
+    # The header is read first so missing columns are left out (and reported by
+    # validation) rather than failing the read.
+    header = read_csv_header(file_bytes)
+    include_columns = [col for col in [*_mapping_constants()["source_columns"], *extra_columns] if col in header]
+    
+    # Read all values as strings: downstream processing is string-only, and this
+    # keeps ZIP codes from being formatted as decimals
+    parse_options = pacsv.ParseOptions(newlines_in_values=True)
+    convert_options = pacsv.ConvertOptions(
+        include_columns=include_columns,
+        column_types={col: pa.string() for col in include_columns},
+        strings_can_be_null=True
+    )
+    
+    if len(file_bytes) <= block_size:
+        # Keep the Arrow-backed strings so .str operations run on Arrow kernels
+        table = pacsv.read_csv(io.BytesIO(file_bytes), parse_options=parse_options, convert_options=convert_options)
+        yield table.to_pandas(types_mapper=pd.ArrowDtype)
+        return
+    
+    reader = pacsv.open_csv(
+        io.BytesIO(file_bytes),
+        read_options=pacsv.ReadOptions(block_size=block_size),
+        parse_options=parse_options,
+        convert_options=convert_options
+    )
+    
+    rows_read = 0
+    for batch in reader:
+        # Keep the Arrow-backed strings so .str operations run on Arrow kernels
+        chunk = batch.to_pandas(types_mapper=pd.ArrowDtype)
+        chunk.index = pd.RangeIndex(rows_read, rows_read + len(chunk))
+        rows_read += len(chunk)
+        yield chunk
+    
+    if rows_read == 0:
+        yield reader.schema.empty_table().to_pandas(types_mapper=pd.ArrowDtype)
+
+def read_csv_chunks_pandas(file_bytes: bytes, chunksize: int = PANDAS_CHUNK_ROWS,
+                           extra_columns: Iterable[str] = ()) -> Iterator[pd.DataFrame]:
+    """
+    Stream the uploaded CSV with the pandas C reader, as a fallback for read_csv_chunks.
+    
+    The Arrow reader rejects rows with fewer fields than the header (e.g. from
+    tools that drop trailing empty fields); pandas pads them with NaN instead.
+    
+    Args:
+        file_bytes: Raw bytes of the uploaded CSV file
+        chunksize: Number of rows per chunk
+        extra_columns: Unmapped columns to read as well, e.g. the dedup key
+        
+    Yields:
+        Input DataFrame chunks, indexed by row number in the file. A file with
+        no data rows yields a single empty chunk.
+    """
+    include_columns = {*_mapping_constants()["source_columns"], *extra_columns}
+    
+    # Read all values as strings, as in read_csv_chunks
+    yield from pd.read_csv(
+        io.BytesIO(file_bytes),
+        usecols=lambda col: col in include_columns,
+        dtype=str,
+        chunksize=chunksize
+    )
+
+# The cached helpers below are keyed on the uploaded file's id instead of its
+# bytes (passed as the unhashed _file_bytes): hashing a large upload on every
+# rerun would cost more than the cache saves.
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)
+def _load_header(file_id: str, _file_bytes: bytes) -> List[str]:
+    """
+    Cached wrapper around read_csv_header.
+    
+    Args:
+        file_id: Id of the uploaded file, used as the cache key
+        _file_bytes: Raw bytes of the uploaded CSV file (not hashed)
+        
+    Returns:
+        Column names in file order
+    """
+    return read_csv_header(_file_bytes)
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)
+def _load_preview(file_id: str, _file_bytes: bytes) -> pd.DataFrame:
+    """
+    Parse the first rows of the uploaded CSV for preview and validation.
+    
+    Args:
+        file_id: Id of the uploaded file, used as the cache key
+        _file_bytes: Raw bytes of the uploaded CSV file (not hashed)
+        
+    Returns:
+        First 5 rows of the mapped input columns
+    """
+    try:
+        return next(read_csv_chunks(_file_bytes, block_size=PREVIEW_BLOCK_SIZE)).head()
+    except pa.ArrowInvalid:
+        return next(read_csv_chunks_pandas(_file_bytes)).head()
+
+@st.cache_resource(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)
+def _process(file_id: str, _file_bytes: bytes, property_ref_code: str, present_columns: Dict[str, str],
+             dedup_key: Optional[str] = None) -> Tuple[pd.DataFrame, int, int]:
+    """
+    Stream the uploaded CSV through process_csv_chunks, cached on the file id and reference code.
+    
+    Uses st.cache_resource so a cache hit returns the output frame itself
+    rather than unpickling a copy of it.
+    
+    Args:
+        file_id: Id of the uploaded file, used as the cache key
+        _file_bytes: Raw bytes of the uploaded CSV file (not hashed)
+        property_ref_code: Custom property reference code
+        present_columns: Result of find_mapped_columns for the uploaded file
+        dedup_key: Unique record id column to deduplicate on, if any
+        
+    Returns:
+        Tuple of (processed DataFrame with mapped columns, number of input records,
+        number of duplicates removed). Callers must not mutate the DataFrame.
+    """
+    extra_columns = [dedup_key] if dedup_key is not None else []
+    try:
+        return process_csv_chunks(
+            read_csv_chunks(_file_bytes, extra_columns=extra_columns),
+            property_ref_code, present_columns, dedup_key
+        )
+    except pa.ArrowInvalid:
+        # The parse error can come from any chunk, so start over with the
+        # pandas reader rather than resuming mid-file
+        return process_csv_chunks(
+            read_csv_chunks_pandas(_file_bytes, extra_columns=extra_columns),
+            property_ref_code, present_columns, dedup_key
+        )
+
+@st.cache_resource(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)
+def _to_csv(file_id: str, property_ref_code: str, dedup_key: Optional[str],
+            _df: pd.DataFrame) -> bytes:
+    """
+    Serialize the mapped DataFrame for download, cached across reruns.
+    
+    The cache is keyed on the exact inputs to _process rather than on the
+    frame: Streamlit only samples the rows of large frames when hashing them,
+    so two different outputs could otherwise share a cache entry.
+    
+    Args:
+        file_id: Id of the uploaded file, used as the cache key
+        property_ref_code: Custom property reference code
+        dedup_key: Unique record id column used for deduplication, if any
+        _df: Mapped DataFrame returned by _process for these inputs (not hashed)
+        
+    Returns:
+        UTF-8 encoded CSV bytes
+    """
+    # Write straight into a byte buffer rather than building the CSV text and
+    # encoding it afterwards
+    buffer = io.BytesIO()
+    _df.to_csv(buffer, index=False, encoding='utf-8')
+    return buffer.getvalue()
+
+@st.cache_resource
+def _mapping_status_table(present_sources: Tuple[str, ...]) -> pd.DataFrame:
+    """
+    Build the column mapping details table, cached on the set of present source columns.
+    
+    Args:
+        present_sources: Source columns found in the input, e.g. tuple(find_mapped_columns(df))
+        
+    Returns:
+        Mapping table with a found/missing status per source column. Callers
+        must not mutate it.
+    """
+    return _mapping_constants()["mapping_table"].assign(Status=[
+        "✅ Found" if k in present_sources else "❌ Missing"
+        for k in _mapping_constants()["source_columns"]
+    ])
+
 def main():
     st.title("🏠 Property CSV Mapper")
     st.markdown("---")
@@ -176,22 +594,40 @@ def main():
     
     if uploaded_file is not None and property_ref_code:
         try:
-            # Read the CSV file with ZIP codes as strings to prevent decimal formatting
-            df = pd.read_csv(uploaded_file, dtype={
-                'OWNER_ZIP': str,
-                'PROP_ZIP': str
-            })
+            file_id = uploaded_file.file_id
+            file_bytes = uploaded_file.getvalue()
+            preview_df = _load_preview(file_id, file_bytes)
+            present_columns = find_mapped_columns(preview_df)
             
-            st.success(f"✅ File uploaded successfully! Found {len(df)} rows and {len(df.columns)} columns.")
+            # The row count is only known once the file has been processed
+            upload_message = st.empty()
+            upload_message.success(f"✅ File uploaded successfully! Found {len(present_columns)} of {len(COLUMN_MAPPING)} expected columns.")
             
             # Show preview of input data
             with st.expander("📊 Preview Input Data (First 5 rows)"):
-                st.dataframe(df.head())
+                st.dataframe(preview_df)
             
             # Validate input
-            if validate_input_file(df):
+            if validate_input_file(present_columns):
+                # Offer a unique record id column as the dedup key when the file has one
+                dedup_key = None
+                dedup_key_options = [col for col in DEDUP_KEY_COLUMNS if col in _load_header(file_id, file_bytes)]
+                if dedup_key_options:
+                    dedup_key_choice = st.selectbox(
+                        "Dedup key",
+                        [AUTO_DEDUP_KEY] + dedup_key_options,
+                        help="Deduplicate on a unique parcel id instead of owner name + mailing address. "
+                             "This removes repeated parcels rather than repeated recipients."
+                    )
+                    if dedup_key_choice != AUTO_DEDUP_KEY:
+                        dedup_key = dedup_key_choice
+                
                 # Process the CSV (includes mapping, custom field, and deduplication)
-                mapped_df, duplicates_removed = process_csv(df, property_ref_code)
+                mapped_df, input_records, duplicates_removed = _process(
+                    file_id, file_bytes, property_ref_code, present_columns, dedup_key
+                )
+                
+                upload_message.success(f"✅ File uploaded successfully! Found {input_records} rows and {len(present_columns)} of {len(COLUMN_MAPPING)} expected columns.")
                 
                 st.header("✨ Processing Results")
                 
@@ -210,7 +646,7 @@ def main():
                 # Summary statistics
                 col1, col2, col3, col4 = st.columns(4)
                 with col1:
-                    st.metric("Input Records", len(df))
+                    st.metric("Input Records", input_records)
                 with col2:
                     st.metric("Duplicates Removed", duplicates_removed)
                 with col3:
@@ -221,19 +657,17 @@ def main():
                 # Processing summary
                 st.info(f"""
                 📋 **Processing Summary:**
-                • Original records: {len(df):,}
+                • Original records: {input_records:,}
                 • Duplicates removed: {duplicates_removed:,}
                 • Final unique records: {len(mapped_df):,}
-                • Deduplication rate: {(duplicates_removed/len(df)*100):.1f}%
+                • Deduplication rate: {(duplicates_removed/input_records*100):.1f}%
                 """)
                 
                 # Download section
                 st.header("💾 Download Mapped CSV")
                 
                 # Convert DataFrame to CSV
-                csv_buffer = io.StringIO()
-                mapped_df.to_csv(csv_buffer, index=False)
-                csv_data = csv_buffer.getvalue()
+                csv_data = _to_csv(file_id, property_ref_code, dedup_key, mapped_df)
                 
                 # Generate filename using date + property reference code + "DirectSkip_Import"
                 output_filename = generate_output_filename(property_ref_code)
@@ -251,10 +685,7 @@ def main():
                 
                 # Show mapping summary
                 with st.expander("🔍 Column Mapping Details"):
-                    mapping_df = pd.DataFrame([
-                        {"Source Column": k, "Target Column": v, "Status": "✅ Found" if k in df.columns else "❌ Missing"}
-                        for k, v in COLUMN_MAPPING.items()
-                    ])
+                    mapping_df = _mapping_status_table(tuple(present_columns))
                     st.dataframe(mapping_df, use_container_width=True)
                 
                 # Show deduplication details
@@ -265,7 +696,7 @@ def main():
                     - Runs BEFORE column mapping (uses original column names)
                     - Converts text to uppercase for case-insensitive comparison
                     - Keeps the first occurrence of each unique combination
-                    - Removes temporary matching columns after processing
+                    - Compares the normalized columns directly, without building temporary matching columns
                     
                     **Why This Works:**
                     - Same owner name + same mailing address = likely duplicate
@@ -273,6 +704,10 @@ def main():
                     - Accounts for slight formatting differences in text
                     - Preserves data integrity by keeping complete first occurrence
                     - Focuses on unique recipients rather than unique properties
+                    
+                    **Dedup Key:**
+                    - If the file has a parcel id column (APN or PARCEL_ID), it can be selected as the dedup key instead
+                    - Records are then deduplicated on that id as-is; records without an id are kept
                     """)
         
         except Exception as e: